@@ -2,10 +2,22 @@ from networkx import find_cycle, DiGraph
 from networkx.exception import NetworkXNoCycle
 from networkx.algorithms.dag import dag_longest_path, dag_longest_path_length
 from copy import deepcopy
-from random import choice
+from random import Random
 from argparse import ArgumentParser
 import numpy as np
-from threading import Thread
+from threading import Thread, Lock, current_thread
+from time import perf_counter
+import json
+import sys
+
+
+EURISTICHE = ("LPT", "SPT", "MIS", "MWKR")
+
+DEBUG = 10      # ogni passo dei cicli interni: candidate, scelte, mosse
+INFO = 20       # una riga per iterazione, soluzioni di partenza e migliori trovate
+SPENTO = 100    # nessun evento
+LIVELLI = {"DEBUG": DEBUG, "INFO": INFO, "SPENTO": SPENTO}
+
 
 def read_input(istanza):
 
@@ -48,6 +60,86 @@ class BgColors:
     UNDERLINE = '\033[4m'
 
 
+class LogEventi:
+    '''
+        Log strutturato e a livelli degli eventi dell'algoritmo, che sostituisce le stampe a schermo nei cicli.
+        Ogni evento è una tupla (t, livello, evento, thread, campi) che viene solo accodata in un buffer:
+        la formattazione avviene quando il buffer si svuota sul sink, e solo per i livelli abilitati.
+        Attributi:
+        - livello minimo degli eventi registrati
+        - sink, file di testo su cui scrivere un evento JSON per riga, oppure coda (con metodo put) 
+        su cui inoltrare le tuple così come sono, senza formattarle
+        - dim_buffer, numero di eventi oltre il quale il buffer viene svuotato sul sink
+    '''
+
+    def __init__(self, livello=SPENTO, sink=None, dim_buffer=1024):
+        self.livello = livello if sink is not None else SPENTO
+        self.sink = sink
+        self.dim_buffer = dim_buffer
+        self.buffer = []
+        self.lock = Lock()
+        self.t0 = perf_counter()
+
+    def abilitato(self, livello):
+        return livello >= self.livello
+
+    def emit(self, livello, evento, **campi):
+        if livello < self.livello:
+            return
+        record = (perf_counter() - self.t0, livello, evento, current_thread().name, campi)
+        # il log è condiviso tra i thread: accodamento e svuotamento avvengono sotto lo stesso lock, 
+        # altrimenti un evento accodato mentre un altro thread svuota il buffer andrebbe perso
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.dim_buffer:
+                self._svuota()
+
+    def debug(self, evento, **campi):
+        if DEBUG >= self.livello:
+            self.emit(DEBUG, evento, **campi)
+
+    def info(self, evento, **campi):
+        if INFO >= self.livello:
+            self.emit(INFO, evento, **campi)
+
+    def flush(self):
+        with self.lock:
+            self._svuota()
+
+    def _svuota(self):
+        ''' scrivo sul sink gli eventi nel buffer, da chiamare tenendo self.lock '''
+
+        eventi, self.buffer = self.buffer, []
+        if hasattr(self.sink, "put"):
+            for e in eventi:
+                self.sink.put(e)
+        elif eventi:
+            self.sink.write("".join(formatta_evento(e) + "\n" for e in eventi))
+            self.sink.flush()
+
+    def close(self):
+        if self.sink is not None:
+            self.flush()
+
+
+def formatta_evento(evento):
+    ''' serializzo un evento del LogEventi in una riga JSON compatta '''
+
+    t, livello, nome, thread, campi = evento
+    record = {"t": round(t, 6), "l": livello, "e": nome, "th": thread}
+    record.update(campi)
+    return json.dumps(record, separators=(",", ":"), default=lambda o: o.item() if hasattr(o, "item") else str(o))
+
+
+def leggi_log(path):
+    ''' rileggo un log scritto da LogEventi, restituendo un dizionario per evento nell'ordine in cui sono stati emessi '''
+
+    with open(path) as f:
+        for riga in f:
+            if riga.strip():
+                yield json.loads(riga)
+
+
 class Job:
     '''
         Un job è formato da una lista di operazioni da eseguire sulle macchine
@@ -130,36 +222,26 @@ class Tabu:
 
 
 
-def print_soluzione(soluzione):
-    ''' stampo la struttura dati che contiene la soluzione parziale corrente '''
+def ids_soluzione(soluzione):
+    ''' per ogni macchina la lista degli id delle operazioni in soluzione, forma compatta per il log '''
 
-    if verbose: 
-        for i in range(len(soluzione)):
-            print("M{}: ".format(i+1), end="")
-            print([op.id for op in soluzione[i]])
+    return [[op.id for op in ops] for ops in soluzione]
 
 
-def print_groundset(groundset):
-    ''' stampo la lista delle code di processamento con le macchine divise per job di appartenenza'''
+def ids_groundset(groundset):
+    ''' per ogni macchina e per ogni job la lista degli id delle operazioni ancora da processare, forma compatta per il log '''
 
-    if verbose: 
-        print("Code di processamento")
-        for m in range(len(groundset)):
-            print("M{}: ".format(m+1), end="")
-            job = groundset[m]
-            for j in range(len(job)):
-                print("{}".format([op.id for op in job[j]]), end=", ")
-            print()   
+    return [[[op.id for op in job] for job in jobs] for jobs in groundset]
 
 
-def print_lista_soluzioni(p):
+def print_lista_soluzioni(p, risolutore):
     ''' stampo lista dei valori di f.o. delle soluzioni trovate attraverso Soluzione.find_greedy_solution() '''
 
     soluzioni = p.lista_soluzioni
     best = min(soluzioni, key=lambda s: s.makespan)
-    if multistart <= 1:
+    if risolutore.multistart <= 1:
         print(BgColors.OKBLUE + "[{}]".format(p.euristica)+ BgColors.ENDC, end=" ")
-    print(BgColors.OKBLUE + "({}, {}, {})".format(tabusearch.max_iter, tabusearch.dim, tabusearch.stallo) + BgColors.ENDC, [s.makespan for s in soluzioni], "\t", BgColors.OKGREEN + "best = {}".format(best.makespan) + BgColors.ENDC)
+    print(BgColors.OKBLUE + "({}, {}, {})".format(risolutore.max_iter, risolutore.tabu_list_dim, risolutore.stallo) + BgColors.ENDC, [s.makespan for s in soluzioni], "\t", BgColors.OKGREEN + "best = {}".format(best.makespan) + BgColors.ENDC)
     
 
 def get_ops_by_jobid(job_id, operazioni):
@@ -195,8 +277,6 @@ def build_collections(n, m, macchine_associate, durate_ops):
 
     jobs = []
     operazioni = []
-    if verbose:
-        print("Sono stati creati i seguenti oggetti:")
 
     # creo la lista delle macchine
     macchine = [Macchina(id=id+1) for id in range(m)]
@@ -217,8 +297,6 @@ def build_collections(n, m, macchine_associate, durate_ops):
                 macchina=macchine[macchina_id]
             )
             operazioni.append(nuova_operazione) # riempio lista di tutte operazioni
-            if verbose:
-                print(nuova_operazione.__str__())
             index += 1           
 
     for m in macchine:
@@ -230,7 +308,6 @@ def build_collections(n, m, macchine_associate, durate_ops):
         nuovo_job = Job(id=j+1, lista_operazioni=ops)
         jobs.append(nuovo_job)
     
-    if verbose: print();
     return jobs, operazioni, macchine
 
 
@@ -253,11 +330,14 @@ def stop_conditions(ground_set):
     return empty
 
 
-def heuristic_sort(operazioni, tutte_ops, euristica):
-    ''' ordino una lista di operazioni in base ad un criterio euristico sulla durata dell'operazione '''
+def heuristic_sort(operazioni, tutte_ops, euristica, rng=None):
+    ''' 
+        ordino una lista di operazioni in base ad un criterio euristico sulla durata dell'operazione,
+        se rng non è None l'euristica viene invece scelta casualmente ad ogni chiamata
+    '''
 
-    if tabu_search and multistart > 1:
-        euristica = choice(opts)
+    if rng is not None:
+        euristica = rng.choice(EURISTICHE)
 
     if euristica == "LPT":
         sorted_ops = sorted(operazioni, reverse=True, key=lambda o: o.durata)
@@ -267,7 +347,7 @@ def heuristic_sort(operazioni, tutte_ops, euristica):
 
     elif euristica == "MIS": # maggior numero di successori, conto i successori
         mapp = {o:o.get_successori(tutte_ops) for o in operazioni}
-        sorted_map = sorted(mapp.items(), reverse=True, key=lambda el: len(el))
+        sorted_map = sorted(mapp.items(), reverse=True, key=lambda el: len(el[1]))
         sorted_ops = [op for (op, _) in sorted_map]
 
     elif euristica == "MWKR": # maggior quantità di tempo-lavoro rimanente dopo il completamento, sommo le durate
@@ -278,6 +358,25 @@ def heuristic_sort(operazioni, tutte_ops, euristica):
     return sorted_ops, euristica
 
 
+def calcola_chiavi_priorita(jobs, n_operazioni):
+    ''' 
+        calcolo in un colpo solo le chiavi di priorità di tutte le euristiche, una riga per euristica 
+        (nell'ordine di EURISTICHE) e una colonna per operazione: l'operazione con chiave minore ha la precedenza
+    '''
+
+    durate = np.zeros(n_operazioni)
+    successori = np.zeros(n_operazioni)
+    lavoro_rimanente = np.zeros(n_operazioni)
+    for job in jobs:
+        indici = np.array([op.id-1 for op in job.lista_operazioni])
+        d = np.array([op.durata for op in job.lista_operazioni], dtype=float)
+        durate[indici] = d
+        successori[indici] = np.arange(len(indici))[::-1]
+        lavoro_rimanente[indici] = np.cumsum(d[::-1])[::-1] - d # somma delle durate dei successori
+
+    return np.vstack([-durate, durate, -successori, -lavoro_rimanente])
+
+
 def prune_ops(jobs):
     ''' 
         elimino da una lista di operazioni quelle che sono sicuro a priori 
@@ -357,27 +456,25 @@ def halt(l_sols, k, search):
         return k >= search.max_iter
 
 
-def find_best(p, search):
+def find_best(p, search, partenza=None):
+    ''' tabu search a partire dalla soluzione partenza, se None la calcolo con Problema.find_greedy_solution() '''
+
     s = p.lista_soluzioni
+    log = p.log
 
     k = 0
-    s.append(p.find_greedy_solution())
+    s.append(partenza if partenza is not None else p.find_greedy_solution())
     best = s[k]
-    if verbose:
-        print(BgColors.OKBLUE+"Soluzione di partenza")
-        print_soluzione(s[k].soluzione)
-        print("Costo: {}".format(s[k].makespan))
-        print("\nTabu list: {}\n".format(search.tabulist)+BgColors.ENDC)
+    if log.abilitato(INFO):
+        log.info("tabu.partenza", makespan=s[k].makespan, soluzione=ids_soluzione(s[k].soluzione), tabulist=list(search.tabulist))
 
     while not halt(p.lista_soluzioni, k, search):
 
-        if verbose:
-            print(u'\u2500' * 100)
-            print("Iterazione", k+1)
+        log.info("tabu.iterazione", k=k+1, makespan=s[k].makespan, best=best.makespan)
         
         lista_ordinata = s[k].esplora_intorno()
-        if verbose:
-            print("Lista delle mosse possibili:", [(a,b)for (_, (a,b)) in lista_ordinata])
+        if log.abilitato(DEBUG):
+            log.debug("tabu.intorno", mosse=[mossa for (_, mossa) in lista_ordinata])
 
         flag_loop = 0
         n_mosse = len(lista_ordinata)
@@ -387,60 +484,40 @@ def find_best(p, search):
             curr = lista_ordinata[i][0]
             mossa = lista_ordinata[i][1]
 
-            if verbose:
-                print("Estraggo S_curr, con mossa {}:".format(mossa))
-                print_soluzione(curr.soluzione)
-                print("Costo: {}\n".format(curr.makespan))
+            if log.abilitato(DEBUG):
+                log.debug("tabu.candidata", mossa=mossa, makespan=curr.makespan, soluzione=ids_soluzione(curr.soluzione))
             
             # criterio di aspirazione
-            if verbose:
-                print("Test su criterio di attivazione...")
             if curr.getobjval() < best.getobjval(): # se la corrente è migliore dell'ottimo candidato
-                if verbose:
-                    print(BgColors.OKGREEN+"Successo! La soluzione S_curr diventa ottimo candidato! f(S_curr) < f(S_best)\nMi sposto su questa nuova soluzione\n"+BgColors.ENDC)
+                log.info("tabu.aspirazione", mossa=mossa, makespan=curr.makespan)
                 best = curr                         # aggiorno l'ottimo candidato
                 s.append(curr)                      # e mi sposto su questa soluzione
                 k += 1
                 # esco dal ciclo perchè ho trovato una soluzione migliore dell'ottimo candidato
                 # su cui mi sposto con sicurezza     
                 break
-            else:
-                if verbose:
-                    print(BgColors.FAIL+"Fallito. La soluzione S_curr non è migliore dell'ottimo candidato\n"+BgColors.ENDC)
             
-            if verbose:
-                print("Stato della Tabulist: {}".format(search.tabulist))
             if mossa not in search.tabulist:
-                if verbose:
-                    print(BgColors.OKGREEN+"La mossa {} NON è vietata dalla tabulist\nPosso spostarmi sulla soluzione generata da {}".format(mossa, mossa)+BgColors.ENDC)
+                log.debug("tabu.mossa", mossa=mossa, vietata=False)
                 s.append(curr)
-                if verbose:
-                    print("Aggiungo {} nella tabulist".format(inv(mossa)))
                 search.tabulist.append(inv(mossa))
                 if len(search.tabulist) > search.dim:
                     forgotten = search.tabulist.pop(0)
-                    if verbose:
-                        print("Cancello dalla tabulist la mossa {}".format(forgotten))
+                    log.debug("tabu.dimentica", mossa=forgotten)
                 k += 1
                 # posso eseguire la mossa perchè non è vietata, altrimenti di nuovo avrei dovuto 
                 # iterare per provare la prossima soluzione trovata dalla best
                 break
             else:
-                if verbose:
-                    print("Non posso eseguire la mossa {} perché è vietata dalla tabulist\n".format(mossa))
+                log.debug("tabu.mossa", mossa=mossa, vietata=True)
             
             # controllo se ho terminato di le possibli mosse dell'intorno corrente
             if flag_loop >= n_mosse:
-                if verbose:
-                    print(BgColors.FAIL+"Termino la ricerca. Non posso scegliere nessuna mossa dell'intorno"+BgColors.ENDC)
+                log.info("tabu.intorno_esaurito", k=k+1)
                 return best
-                
-            if verbose:
-                print(BgColors.FAIL + "Seleziono la prossima soluzione utile\n"+BgColors.ENDC)
 
-        
-        if verbose:
-            print("Tabulist aggiornata: {}\n".format(search.tabulist))
+        if log.abilitato(DEBUG):
+            log.debug("tabu.tabulist", tabulist=list(search.tabulist))
 
     return best
 
@@ -448,9 +525,14 @@ def find_best(p, search):
 class Problema:
     ''' Istanza del problema, memorizza lista delle soluzioni trovate '''
 
-    def __init__(self, n, m, macchine_associate, durate_ops, euristica):
-        ''' prendo in input l'istanza del problema, istanzio le strutture dati e il grafo iniziale senza archi disgiuntivi '''
+    def __init__(self, n, m, macchine_associate, durate_ops, euristica, rng=None, log=None):
+        ''' 
+            prendo in input l'istanza del problema, istanzio le strutture dati e il grafo iniziale senza archi disgiuntivi.
+            Se rng non è None, l'algoritmo greedy sceglie casualmente l'euristica ad ogni passo
+        '''
 
+        self.log = log if log is not None else LogEventi()
+        self.rng = rng
         self.lista_soluzioni = []
         self.jobs, self.operazioni, self.macchine = build_collections(n, m, macchine_associate, durate_ops)
         self.grafo_iniziale = build_graph(self.jobs, self.operazioni)
@@ -461,61 +543,101 @@ class Problema:
 
         ground_set = build_groundset(self.jobs, deepcopy(self.macchine))
         soluzione_parziale = [[] for i in self.macchine]
+        log = self.log
         
         k = 0
-        print_groundset(ground_set)
-        if verbose:
-            print("S_{}".format(k))
-        print_soluzione(soluzione_parziale); 
-        if verbose: print()
+        if log.abilitato(DEBUG):
+            log.debug("greedy.groundset", k=k, groundset=ids_groundset(ground_set))
 
         while not stop_conditions(ground_set):
-            if verbose:
-                print(u'\u2501' * 100)
-                print("Iterazione k={}\n".format(k+1))
-
             for m_index in range(len(ground_set)):
                 possibili_operazioni = prune_ops(ground_set[m_index])
-                possibili_operazioni_ordinate, heur = heuristic_sort(operazioni=possibili_operazioni, tutte_ops=self.operazioni, euristica=self.euristica)
-                if possibili_operazioni_ordinate != []:
-                    if verbose:
-                        print("Seleziono per M{} con euristica {} tra le seguenti: {}".format(m_index+1, heur, ["{}(d={})".format(op.id, op.durata) for op in possibili_operazioni_ordinate]))
+                possibili_operazioni_ordinate, heur = heuristic_sort(operazioni=possibili_operazioni, tutte_ops=self.operazioni, euristica=self.euristica, rng=self.rng)
+                if possibili_operazioni_ordinate != [] and log.abilitato(DEBUG):
+                    log.debug("greedy.candidate", k=k+1, m=m_index+1, euristica=heur, ops=[op.id for op in possibili_operazioni_ordinate])
                 
                 for z in range(len(possibili_operazioni_ordinate)):
                     
                     # controllo se posso scegliere effettivamente questa operazione per mantenere l'ammissibilità futura
                     chosen = possibili_operazioni_ordinate[z]
-                    if verbose:
-                        print("provo {}".format(chosen.id))
                     if is_secure(ground_set, chosen):
                         soluzione_parziale[m_index].append(chosen)
-                        if verbose:
-                            print(BgColors.OKGREEN+"Aggiungo l'operazione {} su M{}".format(chosen.id, m_index+1))
-                            print(BgColors.ENDC)
+                        log.debug("greedy.scelta", m=m_index+1, op=chosen.id)
                         # a questo punto posso eliminare dal groundset l'operazione che ho appena deciso di inserire in soluzione
                         ground_set[m_index][chosen.job_id-1].remove(chosen)
                         
                         # e ora posso uscire dal ciclo perchè ho scelto l'operazione da inserire
                         break
                     else:
-                        if verbose:
-                            print(BgColors.FAIL+"Rifiuto di aggiungere l'operazione {} in M{} perchè mi porterrebbe all'ammissibilità".format(chosen.id, m_index+1))
-                            print(BgColors.ENDC)
+                        log.debug("greedy.rifiuto", m=m_index+1, op=chosen.id)
 
             k += 1
-            print_groundset(ground_set)
-            if verbose:
-                print("S_{}".format(k))
-            print_soluzione(soluzione_parziale)
+            if log.abilitato(DEBUG):
+                log.debug("greedy.iterazione", k=k, soluzione=ids_soluzione(soluzione_parziale))
         
         s = Soluzione(problema=self, soluzione=soluzione_parziale, grafo=deepcopy(self.grafo_iniziale))
-        if verbose:
-            print(u'\u2501' * 100)
-            print("Euristica: {}".format(heur))
-            print(s.__str__())
+        log.info("greedy.soluzione", euristica=heur, makespan=s.makespan, cammino_critico=s.cammino_critico[1:-1])
         
         return s
 
+    def find_portfolio_solutions(self):
+        ''' 
+            costruisco in un'unica passata vettorizzata le soluzioni greedy di tutte le euristiche in EURISTICHE.
+            Ad ogni iterazione ciascuna macchina sceglie, tra i job la cui prossima operazione va eseguita su di essa, 
+            quella con chiave di priorità minore: è la stessa scelta di find_greedy_solution(), ma senza deepcopy né groundset. 
+            Il makespan si ottiene direttamente dai tempi di completamento, perchè l'ordine di costruzione è topologico.
+            Ritorna la lista di tuple (makespan, euristica, sequenze) ordinata per makespan crescente, 
+            dove sequenze contiene per ogni macchina la lista degli id delle operazioni
+        '''
+
+        n_euristiche = len(EURISTICHE)
+        n_jobs = len(self.jobs)
+        n_operazioni = len(self.operazioni)
+        chiavi = calcola_chiavi_priorita(self.jobs, n_operazioni)
+
+        # per ogni job gli indici delle sue operazioni, con -1 come sentinella di job terminato
+        max_len = max(len(job.lista_operazioni) for job in self.jobs)
+        ops_job = np.full((n_jobs, max_len+1), -1)
+        for j, job in enumerate(self.jobs):
+            ops_job[j, :len(job.lista_operazioni)] = [op.id-1 for op in job.lista_operazioni]
+        macchina_op = np.array([op.macchina.id-1 for op in self.operazioni] + [-1])
+        durata_op = np.array([op.durata for op in self.operazioni] + [0])
+
+        righe = np.arange(n_euristiche)
+        prossima = np.zeros((n_euristiche, n_jobs), dtype=int)
+        fine_job = np.zeros((n_euristiche, n_jobs), dtype=durata_op.dtype)
+        fine_macchina = np.zeros((n_euristiche, len(self.macchine)), dtype=durata_op.dtype)
+        sequenze = [[[] for _ in self.macchine] for _ in EURISTICHE]
+
+        while (ops_job[np.arange(n_jobs), prossima] >= 0).any():
+            for m_index in range(len(self.macchine)):
+                candidate = ops_job[np.arange(n_jobs), prossima] # prossima operazione di ogni job, per ogni euristica
+                ammesse = macchina_op[candidate] == m_index
+                priorita = np.where(ammesse, chiavi[righe[:, None], candidate], np.inf)
+                scelte = priorita.argmin(axis=1) # a parità di chiave vince il job con indice minore
+                attive = ammesse[righe, scelte]
+                if not attive.any():
+                    continue
+
+                r, j = righe[attive], scelte[attive]
+                op = candidate[r, j]
+                fine = np.maximum(fine_job[r, j], fine_macchina[r, m_index]) + durata_op[op]
+                fine_job[r, j] = fine
+                fine_macchina[r, m_index] = fine
+                prossima[r, j] += 1
+                for e, o in zip(r, op):
+                    sequenze[e][m_index].append(int(o)+1)
+
+        makespan = fine_macchina.max(axis=1)
+        portafoglio = [(makespan[e], EURISTICHE[e], sequenze[e]) for e in range(n_euristiche)]
+        return sorted(portafoglio, key=lambda t: t[0])
+
+    def crea_soluzione(self, sequenze):
+        ''' istanzio la Soluzione a partire, per ogni macchina, dalla lista degli id delle operazioni da eseguire in ordine '''
+
+        soluzione = [[self.operazioni[id-1] for id in sequenza] for sequenza in sequenze]
+        return Soluzione(problema=self, soluzione=soluzione, grafo=deepcopy(self.grafo_iniziale))
+
 
 class Soluzione: 
     '''
@@ -604,7 +726,8 @@ class Soluzione:
         # scorro la lista delle mosse possibili per l'intorno corrente e ne valuto il valore della funzione obiettivo
         for i in range(len(lista_mosse)):
 
-            x_k = deepcopy(self)
+            # il problema è in sola lettura, quindi lo condivido con la copia invece di duplicarlo
+            x_k = deepcopy(self, {id(self.problema): self.problema})
 
             # ad ogni iterazione il grafo si ripristina allo stato iniziale  
             x_k.grafo = deepcopy(x_k.problema.grafo_iniziale)
@@ -638,34 +761,138 @@ class Soluzione:
         return lista_ordinata_fo
 
 
-def handler(start_i, heu):
-    if multistart == 0:
-        heu = opts[start_i]
-    
-    if heu == "auto":
-        heu = choice(opts)
+class Risolutore:
+    '''
+        Risolutore rientrante del problema: porta con sé la configurazione, il generatore di numeri casuali 
+        e il log, senza dipendere da variabili globali. La stessa istanza caricata può essere risolta 
+        più volte, anche in parallelo, con risolutori configurati in modo diverso.
+        Attributi:
+        - istanza, tupla (n, m, macchine_associate, durate_ops) come restituita da read_input()
+        - euristica, multistart, tabu_search, e gli iperparametri della tabu search, come da linea di comando
+        - rng, generatore casuale inizializzato con seed, da cui derivano quelli di ciascuno start
+        - log, LogEventi su cui registrare la computazione
+    '''
 
-    p = Problema(*read_input(istanza), euristica=heu)
-    
-    best = find_best(p, tabusearch)
-
-    if verbose:
-        print(u'\u2501' * 100)
-        print(u'\u2501' * 100)
-        print("Miglior soluzione trovata start {}/{}".format(start_i+1, num_starts))
-        print_soluzione(best.soluzione)
-        if multistart == 0:
-            print("Euristica: {}".format(heu))
-        print(best.__str__(), "\n")
+    def __init__(self, istanza, euristica="auto", multistart=1, tabu_search=False, tabu_list_dim=2, max_iter=5, stallo=3, seed=None, log=None):
+        self.istanza = istanza
+        self.euristica = euristica
+        self.multistart = multistart
+        self.tabu_search = tabu_search
+        self.tabu_list_dim = tabu_list_dim
+        self.max_iter = max_iter
+        self.stallo = stallo
+        self.rng = Random(seed)
+        self.log = log if log is not None else LogEventi()
+
+    def num_starts(self):
+        return self.multistart if self.multistart > 0 else len(EURISTICHE)
+
+    def nuovo_problema(self, euristica, rng=None):
+        return Problema(*self.istanza, euristica=euristica, rng=rng, log=self.log)
+
+    def log_istanza(self):
+        ''' registro le operazioni dell'istanza una volta sola, invece che per ogni Problema costruito dagli start '''
+
+        if not self.log.abilitato(DEBUG):
+            return
+        n, _, macchine_associate, durate_ops = self.istanza
+        index = 0
+        for j in range(n):
+            for i in range(len(macchine_associate[j])):
+                index += 1
+                self.log.debug("operazione", op=index, d=durate_ops[j][i], j=j+1, m=macchine_associate[j][i]+1)
+
+    def risolvi(self):
+        ''' 
+            risolvo l'istanza secondo la configurazione del risolutore, e ritorno una lista di coppie (Problema, migliore Soluzione), 
+            una per ciascuno start. Senza tabu search la lista contiene la sola soluzione greedy
+        '''
+
+        self.log_istanza()
+        if not self.tabu_search:
+            return [self.risolvi_greedy()]
+
+        num_starts = self.num_starts()
+        # i seed di ciascuno start sono estratti prima di avviare i thread, così il risultato è riproducibile
+        seeds = [self.rng.getrandbits(32) for _ in range(num_starts)]
+        partenze = [(self.euristica, None)] * num_starts
+        if self.multistart == 0:
+            # un solo passaggio costruisce le soluzioni di partenza di tutte le euristiche, ordinate per makespan
+            portafoglio = self.nuovo_problema(self.euristica).find_portfolio_solutions()
+            partenze = [(e, sequenze) for (_, e, sequenze) in portafoglio]
+
+        risultati = [None] * num_starts
+        errori = [None] * num_starts
+        threads = [Thread(target=self.handler, args=(i, heu, sequenze, Random(seeds[i]), risultati, errori)) for i, (heu, sequenze) in enumerate(partenze)]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        # un'eccezione in un thread non arriva al chiamante, quindi la rilancio qui
+        for errore in errori:
+            if errore is not None:
+                raise errore
+
+        return risultati
+
+    def risolvi_greedy(self):
+        ''' soluzione greedy, con l'euristica 'auto' tengo la migliore del portafoglio di tutte le euristiche '''
+
+        p = self.nuovo_problema(self.euristica)
+        if self.euristica == "auto":
+            # con una sola costruzione ottengo le soluzioni di tutte le euristiche, e tengo la migliore
+            _, p.euristica, sequenze = p.find_portfolio_solutions()[0]
+            best = p.crea_soluzione(sequenze)
+        else:
+            best = p.find_greedy_solution()
+        p.lista_soluzioni.append(best)
+
+        return p, best
+
+    def handler(self, start_i, heu, sequenze, rng, risultati, errori):
+        ''' 
+            tabu search dello start start_i, con il proprio problema, generatore casuale e tabu list.
+            L'eventuale eccezione viene salvata in errori[start_i], per essere rilanciata da risolvi()
+        '''
+
+        try:
+            risultati[start_i] = self.start(start_i, heu, sequenze, rng, len(risultati))
+        except Exception as e:
+            errori[start_i] = e
+
+    def start(self, start_i, heu, sequenze, rng, num_starts):
+        ''' eseguo lo start start_i e ritorno la coppia (Problema, migliore Soluzione) '''
+
+        if heu == "auto":
+            heu = rng.choice(EURISTICHE)
+
+        # con più start l'euristica del greedy viene scelta casualmente ad ogni passo
+        p = self.nuovo_problema(heu, rng=rng if self.multistart > 1 else None)
+        partenza = p.crea_soluzione(sequenze) if sequenze is not None else None
+        search = Tabu(dim=self.tabu_list_dim, max_iter=self.max_iter, stallo=self.stallo)
         
-    print_lista_soluzioni(p)
+        best = find_best(p, search, partenza)
+
+        if self.log.abilitato(INFO):
+            self.log.info("start.best", start=start_i+1, num_starts=num_starts, euristica=heu, makespan=best.makespan, 
+                          cammino_critico=best.cammino_critico[1:-1], soluzione=ids_soluzione(best.soluzione))
+
+        return p, best
 
 
 if __name__ == "__main__":
     parser = ArgumentParser(description='Il programma risolve il problema del Job Shop Scheduling utilizzando la TabuSearch partendo da una soluzione iniziale calcolata con un algoritmo euristico costruttivo Greedy')
     parser.add_argument('-v', '--verbose', action='store_true', default=False,
-                        help="""Verbose, se è True mostra tutti i dettagli della computazione dell'algoritmo a schermo, 
-                        altrimenti se False mostra solo la soluzione finale calcolata""")
+                        help="""Verbose, se è True registra tutti i dettagli della computazione dell'algoritmo come eventi JSON, uno per riga, 
+                        su stderr (o sul file indicato da --log), altrimenti se False mostra solo la soluzione finale calcolata""")
+    parser.add_argument('-l', '--log', default=None, type=str,
+                        help="""File su cui scrivere il log degli eventi, rileggibile con leggi_log(). 
+                        Se indicato senza --verbose registra solo gli eventi di livello INFO.""")
+    parser.add_argument('-L', '--log_level', default=None, type=str, choices=["DEBUG", "INFO"],
+                        help="""Livello minimo degli eventi registrati nel log. (default = DEBUG se --verbose, altrimenti INFO).""")
 
     parser.add_argument('-i', '--istanza', default="toy", type=str, choices=["toy", "10x10x10"],
                         help="""Scelta dell'istanza da dare in input tra le possibili, cioè [toy, 10x10x10].""")
@@ -674,7 +901,8 @@ if __name__ == "__main__":
                         Se ha valore 0, l'algoritmo esegue un single-start per ciascuna delle possibili euristiche: LPT, SPT, MIS, MWKR""")
     parser.add_argument('-e', '--euristica', default="auto", type=str, choices=["LPT", "SPT", "MIS", "MWKR", "auto"],
                         help="""Euritica di selezione per l'algoritmo greedy, le possibili opzioni sono LPT, SPT, MIS, MWKR, auto. 
-                        Se 'auto' (default = auto) allora viene scelta casualmente dall'algoritmo ad ogni iterazione.""")
+                        Se 'auto' (default = auto) allora viene scelta casualmente dall'algoritmo ad ogni iterazione, 
+                        mentre senza tabu search si tiene la migliore tra le soluzioni greedy di tutte le euristiche.""")
 
     parser.add_argument('-t', '--tabu_search', action='store_true', default=False,
                         help="""Se True, decido di utilizzare la tabu search per migliorare la soluzione iniziale ottenuta dall'algoritmo euristico greedy,
@@ -691,40 +919,45 @@ if __name__ == "__main__":
                         migliora durante la search oltre il quale l'algoritmo termina. 
                         (default = 3).""")
 
+    parser.add_argument('-r', '--seed', default=None, type=int,
+                        help="""Seed del generatore casuale, per rendere riproducibili le scelte casuali dell'euristica. 
+                        (default = None).""")
+
     args = parser.parse_args()
 
     # arguments parser
-    istanza = args.istanza
-    verbose = args.verbose
-    multistart = args.multistart
-    euristica = args.euristica
-    tabu_search = args.tabu_search
-    tabu_list_dim = args.tabu_list_dim
-    max_iter = args.max_iter
-    stallo = args.stallo
-
-    opts = ("LPT", "SPT", "MIS", "MWKR")
-
-    if not tabu_search:
-        if euristica == "auto":
-            euristica = choice(opts)
-
-        p = Problema(*read_input(istanza), euristica=euristica)
-        best = p.find_greedy_solution()
-
-        if not verbose:
-            print_soluzione(best.soluzione)
-            print("Euristica: {}".format(euristica))
+    log = None
+    if args.verbose or args.log is not None:
+        livello = LIVELLI[args.log_level] if args.log_level else (DEBUG if args.verbose else INFO)
+        log = LogEventi(livello=livello, sink=open(args.log, "w") if args.log else sys.stderr)
+
+    risolutore = Risolutore(
+        read_input(args.istanza),
+        euristica=args.euristica,
+        multistart=args.multistart,
+        tabu_search=args.tabu_search,
+        tabu_list_dim=args.tabu_list_dim,
+        max_iter=args.max_iter,
+        stallo=args.stallo,
+        seed=args.seed,
+        log=log
+    )
+
+    try:
+        risultati = risolutore.risolvi()
+
+        if not risolutore.tabu_search:
+            p, best = risultati[0]
+            print("Euristica: {}".format(p.euristica))
             print(best.__str__())
 
-    else:
-        tabusearch = Tabu(dim=tabu_list_dim, max_iter=max_iter, stallo=stallo)
-        
-        num_starts = multistart if multistart > 0 else len(opts)
-        threads = [Thread(target=handler, args=(i, euristica)) for i in range(num_starts)]
-
-        for t in threads:
-            t.start()
-
-        for t in threads:
-            t.join()
\ No newline at end of file
+        else:
+            for p, _ in risultati:
+                print_lista_soluzioni(p, risolutore)
+
+    finally:
+        # anche se la computazione fallisce scrivo gli ultimi eventi del buffer, che sono quelli più utili
+        if log is not None:
+            log.close()
+            if args.log is not None:
+                log.sink.close()
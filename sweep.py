@@ -0,0 +1,235 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from random import Random
+from time import process_time
+import numpy as np
+import json
+import os
+
+from main import Risolutore, read_input, BgColors, EURISTICHE
+
+
+PARAMETRI = ("euristica", "multistart", "tabu_list_dim", "max_iter", "stallo")
+
+CASUALE = "casuale" # con multistart > 1 l'euristica fissata è ignorata: il greedy ne sceglie una a caso ad ogni passo
+
+_istanze = {} # istanze già caricate dal processo worker, per nome
+
+
+def spazio_di_ricerca(valori, n_random=0, seed=0):
+    '''
+        costruisco la lista delle configurazioni da provare, a partire da un dizionario parametro -> lista di valori:
+        se n_random è 0 le provo tutte (grid search), altrimenti ne estraggo n_random a caso (random search),
+        senza ripetere le configurazioni che differiscono solo per un'euristica che viene ignorata
+    '''
+
+    griglia = []
+    viste = set() # configurazioni già in griglia, per controllare i duplicati in tempo costante
+    for c in product(*[valori[p] for p in PARAMETRI]):
+        config = dict(zip(PARAMETRI, c))
+        if config["multistart"] == 0:
+            # con multistart=0 le partenze vengono dal portafoglio di tutte le euristiche, e l'euristica è ignorata
+            config["euristica"] = "auto"
+        elif config["multistart"] > 1 and config["euristica"] != "auto":
+            # l'euristica fissata non conta, ma 'auto' resta distinta perchè consuma un'estrazione in più del generatore
+            config["euristica"] = CASUALE
+        chiave = tuple(config.values())
+        if chiave not in viste:
+            viste.add(chiave)
+            griglia.append(config)
+    if 0 < n_random < len(griglia):
+        griglia = Random(seed).sample(griglia, n_random)
+    return griglia
+
+
+def usa_seed(config):
+    ''' 
+        il seed conta solo se il generatore casuale viene usato: con multistart > 1, oppure con un solo start ed euristica 'auto'.
+        Con multistart=0 o con un'euristica fissata tutti i seed danno lo stesso trial
+    '''
+
+    return config["multistart"] > 1 or (config["multistart"] == 1 and config["euristica"] == "auto")
+
+
+def seeds_config(config, seeds):
+    return seeds if usa_seed(config) else seeds[:1]
+
+
+def chiave_trial(istanza, config, seed):
+    ''' chiave che identifica un trial nella cache su disco '''
+
+    return json.dumps({"istanza": istanza, "config": config, "seed": seed}, sort_keys=True)
+
+
+def leggi_cache(path):
+    ''' 
+        rileggo i trial già completati, un oggetto JSON per riga, indicizzati per chiave_trial().
+        Salto le righe illeggibili, come l'ultima troncata se lo sweep è stato interrotto durante la scrittura
+    '''
+
+    completati = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            for riga in f:
+                try:
+                    t = json.loads(riga)
+                except json.JSONDecodeError:
+                    continue
+                completati[chiave_trial(t["istanza"], t["config"], t["seed"])] = t
+    return completati
+
+
+def esegui_trial(istanza, config, seed):
+    '''
+        eseguo nel processo worker la tabu search con la configurazione e il seed dati, e ne misuro il tempo di CPU.
+        L'istanza viene caricata una sola volta per processo e riutilizzata dai trial successivi
+    '''
+
+    if istanza not in _istanze:
+        _istanze[istanza] = read_input(istanza)
+
+    t0 = process_time()
+    risultati = Risolutore(_istanze[istanza], tabu_search=True, seed=seed, **config).risolvi()
+    cpu = process_time() - t0
+
+    return {
+        "istanza": istanza,
+        "config": config,
+        "seed": seed,
+        "makespan": int(min(best.makespan for (_, best) in risultati)),
+        "partenza": int(min(p.lista_soluzioni[0].makespan for (p, _) in risultati)),
+        "cpu": cpu
+    }
+
+
+def sweep(istanza, configurazioni, seeds, processi=None, cache=None):
+    '''
+        eseguo tutti i trial (configurazione, seed) su un pool di processi, saltando quelli già presenti nella cache.
+        Le configurazioni su cui il seed non ha effetto vengono eseguite solo con il primo seed.
+        Ogni trial completato viene subito aggiunto alla cache, così uno sweep interrotto può essere ripreso
+    '''
+
+    completati = leggi_cache(cache)
+    trials = [(c, s) for c in configurazioni for s in seeds_config(c, seeds)]
+    da_eseguire = [(c, s) for (c, s) in trials if chiave_trial(istanza, c, s) not in completati]
+    print("Trial in cache: {}, da eseguire: {}".format(len(trials) - len(da_eseguire), len(da_eseguire)))
+
+    if da_eseguire:
+        f = open(cache, "a") if cache is not None else None
+        if f is not None and f.tell() > 0:
+            # se l'ultima riga è stata troncata, i nuovi trial iniziano comunque su una riga nuova
+            with open(cache, "rb") as letto:
+                letto.seek(-1, os.SEEK_END)
+                if letto.read(1) != b"\n":
+                    f.write("\n")
+        with ProcessPoolExecutor(max_workers=processi) as pool:
+            futures = [pool.submit(esegui_trial, istanza, c, s) for (c, s) in da_eseguire]
+            for future in as_completed(futures):
+                t = future.result()
+                completati[chiave_trial(istanza, t["config"], t["seed"])] = t
+                if f is not None:
+                    f.write(json.dumps(t) + "\n")
+                    f.flush()
+        if f is not None:
+            f.close()
+
+    return [completati[chiave_trial(istanza, c, s)] for (c, s) in trials]
+
+
+def riassumi(trials, quantile=0.9):
+    '''
+        raggruppo i trial per configurazione, e per ciascuna calcolo media e quantile del makespan,
+        tempo di CPU medio, e miglioramento medio rispetto alla soluzione di partenza per secondo di CPU
+    '''
+
+    gruppi = {}
+    for t in trials:
+        gruppi.setdefault(json.dumps(t["config"], sort_keys=True), []).append(t)
+
+    riassunto = []
+    for chiave, ts in gruppi.items():
+        makespan = np.array([t["makespan"] for t in ts])
+        cpu = np.array([t["cpu"] for t in ts])
+        miglioramento = np.array([t["partenza"] - t["makespan"] for t in ts])
+        riassunto.append({
+            "config": json.loads(chiave),
+            "trials": len(ts),
+            "media": makespan.mean(),
+            "quantile": np.quantile(makespan, quantile),
+            "cpu": cpu.mean(),
+            "efficienza": miglioramento.sum() / max(cpu.sum(), 1e-9)
+        })
+    return riassunto
+
+
+def chiave_ordinamento(criterio):
+    ''' ordino per criterio (crescente per il makespan, decrescente per l'efficienza), e a parità per tempo di CPU '''
+
+    segno = -1 if criterio == "efficienza" else 1
+    return lambda r: (segno * r[criterio], r["cpu"])
+
+
+def print_riassunto(riassunto, ordina="media", quantile=0.9, top=10):
+    ''' stampo le migliori configurazioni secondo il criterio ordina, e la migliore per ciascun criterio '''
+
+    if not riassunto:
+        print("Nessun trial da riassumere")
+        return
+
+    ordinato = sorted(riassunto, key=chiave_ordinamento(ordina))
+
+    print("{:<40} {:>6} {:>10} {:>10} {:>10} {:>12}".format("configurazione", "trials", "media", "q{:g}".format(quantile), "cpu [s]", "miglior./s"))
+    for r in ordinato[:top]:
+        c = r["config"]
+        nome = "{} m={} d={} x={} s={}".format(c["euristica"], c["multistart"], c["tabu_list_dim"], c["max_iter"], c["stallo"])
+        print("{:<40} {:>6} {:>10.1f} {:>10.1f} {:>10.3f} {:>12.1f}".format(nome, r["trials"], r["media"], r["quantile"], r["cpu"], r["efficienza"]))
+
+    print()
+    for criterio in ("media", "quantile", "efficienza"):
+        best = min(riassunto, key=chiave_ordinamento(criterio))
+        print(BgColors.OKGREEN + "best per {}: {} ({:.1f}, cpu = {:.3f}s)".format(criterio, best["config"], best[criterio], best["cpu"]) + BgColors.ENDC)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="""Sweep degli iperparametri della tabu search: esegue su un pool di processi la ricerca per ogni
+                            configurazione e seed, salvando i trial completati su disco in modo da poter riprendere uno sweep interrotto""")
+
+    parser.add_argument('-i', '--istanza', default="toy", type=str, choices=["toy", "10x10x10"],
+                        help="""Scelta dell'istanza da dare in input tra le possibili, cioè [toy, 10x10x10].""")
+    parser.add_argument('-e', '--euristica', default=["auto"], type=str, nargs="+", choices=list(EURISTICHE) + ["auto"],
+                        help="""Euristiche da provare per l'algoritmo greedy. (default = auto).""")
+    parser.add_argument('-m', '--multistart', default=[1], type=int, nargs="+",
+                        help="""Valori da provare per il numero di soluzioni di partenza. (default = 1).""")
+    parser.add_argument('-d', '--tabu_list_dim', default=[2], type=int, nargs="+",
+                        help="""Valori da provare per la dimensione della tabu list. (default = 2).""")
+    parser.add_argument('-x', '--max_iter', default=[5], type=int, nargs="+",
+                        help="""Valori da provare per il massimo numero di iterazioni. (default = 5).""")
+    parser.add_argument('-s', '--stallo', default=[3], type=int, nargs="+",
+                        help="""Valori da provare per il massimo numero di iterazioni senza miglioramento. (default = 3).""")
+
+    parser.add_argument('-n', '--random', default=0, type=int,
+                        help="""Se maggiore di 0, invece di provare tutte le combinazioni dei valori (grid search)
+                        ne estrae casualmente questo numero (random search). (default = 0).""")
+    parser.add_argument('-r', '--seeds', default=3, type=int,
+                        help="""Numero di seed, da 0 a seeds-1, con cui ripetere ciascuna configurazione. Il seed conta solo con 
+                        multistart > 1 o con euristica 'auto', le altre configurazioni sono eseguite una volta sola. (default = 3).""")
+    parser.add_argument('-p', '--processi', default=None, type=int,
+                        help="""Numero di processi del pool. (default = numero di CPU).""")
+    parser.add_argument('-c', '--cache', default=None, type=str,
+                        help="""File su cui salvare i trial completati, uno per riga. Se esiste già, i trial presenti non vengono rieseguiti.""")
+    parser.add_argument('-q', '--quantile', default=0.9, type=float,
+                        help="""Quantile del makespan riportato per ciascuna configurazione. (default = 0.9).""")
+    parser.add_argument('-o', '--ordina', default="media", type=str, choices=["media", "quantile", "efficienza"],
+                        help="""Criterio con cui ordinare le configurazioni: media o quantile del makespan, oppure efficienza,
+                        cioè miglioramento rispetto alla soluzione di partenza per secondo di CPU. (default = media).""")
+
+    args = parser.parse_args()
+    if args.seeds < 1:
+        parser.error("--seeds deve essere almeno 1")
+
+    valori = {p: getattr(args, p) for p in PARAMETRI}
+    configurazioni = spazio_di_ricerca(valori, n_random=args.random)
+
+    trials = sweep(args.istanza, configurazioni, list(range(args.seeds)), processi=args.processi, cache=args.cache)
+    print_riassunto(riassumi(trials, args.quantile), ordina=args.ordina, quantile=args.quantile)